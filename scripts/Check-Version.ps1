@@ -18,6 +18,7 @@
     ./Check-Version.ps1 manifests/Package.checkver.yaml version_info.json
 #>
 
+[CmdletBinding()]
 param(
     [Parameter(Mandatory, Position=0)]
     [string]$CheckverPath,
@@ -28,8 +29,14 @@ param(
 
 $ErrorActionPreference = 'Stop'
 
-# Import module
-Import-Module "$PSScriptRoot/WinGetUpdater.psm1" -Force
+# Verbose tracing is opt-in: -Verbose, or a workflow re-run with debug logging enabled
+if ($env:RUNNER_DEBUG -eq '1') {
+    $VerbosePreference = 'Continue'
+}
+
+# Import module (no -Force: when called repeatedly in one session the loaded module,
+# with its cached HTTP connections and regexes, is reused)
+Import-Module "$PSScriptRoot/WinGetUpdater.psm1"
 
 try {
     $result = Test-PackageUpdate -CheckverPath $CheckverPath -OutputFile $OutputFile
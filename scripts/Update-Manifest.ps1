@@ -6,7 +6,7 @@
 
 .DESCRIPTION
     Fetches existing manifest from microsoft/winget-pkgs, updates it with new version and hashes,
-    and creates a pull request using GitHub API (no repository cloning required)
+    pushes it from a partial, sparse clone of the fork and creates a pull request
 
 .PARAMETER CheckverPath
     Path to checkver config file
@@ -24,6 +24,7 @@
     ./Update-Manifest.ps1 manifests/Microsoft.PowerShell.checkver.yaml Microsoft.PowerShell 7.5.4.0
 #>
 
+[CmdletBinding()]
 param(
     [Parameter(Mandatory, Position=0)]
     [string]$CheckverPath,
@@ -38,23 +39,52 @@ param(
 )
 
 $ErrorActionPreference = 'Stop'
-$VerbosePreference = 'Continue'
 
-# Import module
-Import-Module "$PSScriptRoot/WinGetUpdater.psm1" -Force
+# Verbose tracing is opt-in: -Verbose, or a workflow re-run with debug logging enabled
+if ($env:RUNNER_DEBUG -eq '1') {
+    $VerbosePreference = 'Continue'
+}
+
+# Import module (no -Force: when called repeatedly in one session the loaded module,
+# with its cached HTTP connections and regexes, is reused)
+$modulePath = "$PSScriptRoot/WinGetUpdater.psm1"
+Import-Module $modulePath
 
-# Get cross-platform temp directory
+# Get cross-platform temp directory, preferring the runner's scratch directory over the
+# system temp and, on Linux, RAM-backed /dev/shm when it is writable and roomy enough.
+# Only MSI/MSIX installers are ever written to disk (others are hashed while streaming),
+# so a fixed 2 GB of headroom covers them without a HEAD request per installer
 $TempDir = if ($env:TEMP) { $env:TEMP } elseif ($env:TMPDIR) { $env:TMPDIR } else { '/tmp' }
+if ($env:RUNNER_TEMP) {
+    $TempDir = $env:RUNNER_TEMP
+}
+if ($IsLinux -and [System.IO.Directory]::Exists('/dev/shm')) {
+    try {
+        $shmFree = [System.IO.DriveInfo]::new('/dev/shm').AvailableFreeSpace
+        $probe = Join-Path '/dev/shm' "winget-update-probe-$(Get-Random)"
+        [System.IO.File]::WriteAllBytes($probe, [byte[]]::new(0))
+        [System.IO.File]::Delete($probe)
+        if ($shmFree -ge 2GB) {
+            $TempDir = '/dev/shm'
+        }
+    }
+    catch {
+        Write-Verbose "/dev/shm is not usable: $_"
+    }
+}
+
+# Single per-run work directory for templates, installers and new manifests;
+# removed in the finally block below, including on early exits
+$workDir = Join-Path $TempDir "winget-update-$(Get-Random)"
+$keepWorkDir = $false
+$templateJob = $null
+New-Item -ItemType Directory -Path $workDir -Force | Out-Null
 
 Write-Host "`n======================================" -ForegroundColor Cyan
 Write-Host "WinGet Manifest Updater - PowerShell" -ForegroundColor Cyan
 Write-Host "======================================`n" -ForegroundColor Cyan
 
 try {
-    # Load checkver config
-    Write-Host "Loading checkver config..." -ForegroundColor Cyan
-    $config = Get-CheckverConfig -CheckverPath $CheckverPath
-
     # Auto-derive packageIdentifier
     $filename = Split-Path $CheckverPath -Leaf
     $derivedPackageId = $filename -replace '\.checkver\.yaml$', ''
@@ -63,6 +93,25 @@ try {
         $PackageId = $derivedPackageId
     }
 
+    # Try to load version_info.json if available (written by Check-Version.ps1)
+    $versionInfo = $null
+    if (Test-Path "version_info.json") {
+        try {
+            $versionInfo = Get-Content "version_info.json" -Raw | ConvertFrom-Json
+        }
+        catch {
+            Write-Warning "Could not load metadata from version_info.json: $_"
+        }
+    }
+
+    # Load checkver config, reusing the manifest path Check-Version.ps1 already resolved
+    Write-Host "Loading checkver config..." -ForegroundColor Cyan
+    $knownManifestPath = $null
+    if ($versionInfo -and $versionInfo.packageIdentifier -eq $PackageId) {
+        $knownManifestPath = $versionInfo.manifestPath
+    }
+    $config = Get-CheckverConfig -CheckverPath $CheckverPath -ManifestPath $knownManifestPath
+
     if (-not $Version) {
         Write-Error "Version parameter is required"
         exit 1
@@ -95,26 +144,33 @@ try {
 
     Write-Host "Fork Repository: $forkRepo`n" -ForegroundColor Cyan
 
-    # Try to load metadata from version_info.json if available
+    # Metadata from version_info.json, if it was loaded
     $metadata = @{}
-    if (Test-Path "version_info.json") {
-        try {
-            $versionInfo = Get-Content "version_info.json" -Raw | ConvertFrom-Json
-            if ($versionInfo.metadata) {
-                $metadata = @{}
-                foreach ($property in $versionInfo.metadata.PSObject.Properties) {
-                    $metadata[$property.Name] = $property.Value
-                }
-                Write-Host "Loaded metadata from version_info.json:" -ForegroundColor Cyan
-                foreach ($key in $metadata.Keys) {
-                    Write-Host "  $key = $($metadata[$key])" -ForegroundColor Gray
+    if ($versionInfo -and $versionInfo.metadata) {
+        foreach ($property in $versionInfo.metadata.PSObject.Properties) {
+            $metadata[$property.Name] = $property.Value
+        }
+        Write-Host "Loaded metadata from version_info.json:" -ForegroundColor Cyan
+        foreach ($key in $metadata.Keys) {
+            Write-Host "  $key = $($metadata[$key])" -ForegroundColor Gray
+        }
+        Write-Host ""
+    }
+
+    # Installer digests published upstream (GitHub release asset digests), only trusted
+    # for the same version and installer URL this run resolves
+    $providedHash = $null
+    $providedArchHashes = @{}
+    if ($versionInfo -and $versionInfo.version -eq $Version) {
+        $providedHash = $versionInfo.installerSha256
+        if ($versionInfo.archHashes -and $versionInfo.installerUrls) {
+            foreach ($property in $versionInfo.archHashes.PSObject.Properties) {
+                $providedArchHashes[$property.Name] = @{
+                    Hash = $property.Value
+                    Url = $versionInfo.installerUrls.($property.Name)
                 }
-                Write-Host ""
             }
         }
-        catch {
-            Write-Warning "Could not load metadata from version_info.json: $_"
-        }
     }
 
     # Get installer URL
@@ -131,7 +187,11 @@ try {
         }
         $primaryUrl = $installerUrls['x64']
         if (-not $primaryUrl) {
-            $primaryUrl = $installerUrls.Values | Select-Object -First 1
+            # First value without running the pipeline
+            foreach ($value in $installerUrls.Values) {
+                $primaryUrl = $value
+                break
+            }
         }
     } else {
         # Single architecture
@@ -152,7 +212,12 @@ try {
 
     # Get latest version from winget-pkgs to use as template
     Write-Host "`nFinding latest version in microsoft/winget-pkgs..." -ForegroundColor Cyan
-    $latestVersion = Get-LatestWinGetVersion -ManifestPath $manifestPath
+    if ($versionInfo -and $versionInfo.packageIdentifier -eq $PackageId -and $versionInfo.wingetLatestVersion) {
+        # Already resolved by Check-Version.ps1 in this run
+        $latestVersion = $versionInfo.wingetLatestVersion
+    } else {
+        $latestVersion = Get-LatestWinGetVersion -ManifestPath $manifestPath
+    }
 
     if (-not $latestVersion) {
         Write-Error "Could not find existing version in microsoft/winget-pkgs"
@@ -166,16 +231,17 @@ try {
     $branchName = "$PackageId-$Version"
     Write-Host "`nBranch name: $branchName" -ForegroundColor Cyan
 
-    # Fetch template manifest from upstream
-    $templateDir = Join-Path $TempDir "manifest-template-$(Get-Random)"
+    # Fetch template manifest from upstream in the background, overlapping the installer downloads
+    $templateDir = Join-Path $workDir "template"
     Write-Host "`nFetching template manifest from upstream..." -ForegroundColor Cyan
 
-    if (-not (Get-UpstreamManifest -ManifestPath $manifestPath -Version $latestVersion -OutputPath $templateDir)) {
-        throw "Failed to fetch template manifest"
+    $templateJob = Start-ThreadJob -ScriptBlock {
+        Import-Module $using:modulePath
+        Get-UpstreamManifest -ManifestPath $using:manifestPath -Version $using:latestVersion -OutputPath $using:templateDir -ForkRepo $using:forkRepo
     }
 
     # Create new version directory for manifests
-    $newVersionDir = Join-Path $TempDir "manifest-new-$(Get-Random)"
+    $newVersionDir = Join-Path $workDir "manifest"
     Write-Host "`nCreating new version directory..." -ForegroundColor Cyan
     New-Item -ItemType Directory -Path $newVersionDir -Force | Out-Null
 
@@ -192,53 +258,90 @@ try {
 
     if ($installerUrls) {
         # Multi-architecture: Download each installer and calculate separate hashes
-        Write-Host "Multi-architecture package - downloading all installers..." -ForegroundColor Cyan
-        
+        # MSI/MSIX metadata still needs the file, so only plain installers can skip the download
+        $allHashesProvided = $providedArchHashes.Count -gt 0
         foreach ($arch in $installerUrls.Keys) {
             $url = $installerUrls[$arch]
-            Write-Host "`n  Processing $arch architecture..." -ForegroundColor Cyan
-            Write-Host "    URL: $url" -ForegroundColor Gray
-            
-            # Detect installer type from URL
-            $installerExtension = [System.IO.Path]::GetExtension($url).ToLower()
-            if ($installerExtension -eq '') {
-                # Try to detect from URL pattern
-                if ($url -match '\.msi($|\?)') { $installerExtension = '.msi' }
-                elseif ($url -match '\.msix($|\?)') { $installerExtension = '.msix' }
-                elseif ($url -match '\.appx($|\?)') { $installerExtension = '.appx' }
-                else { $installerExtension = '.exe' }
+            $provided = $providedArchHashes[$arch]
+            if (-not $provided -or $provided.Url -ne $url -or $url -match '\.(msi|msix|appx)($|\?)') {
+                $allHashesProvided = $false
+                break
             }
+        }
 
-            $tempInstaller = Join-Path $TempDir "installer-$arch-$(Get-Random)$installerExtension"
-            $downloadResult = Get-WebFile -Url $url -OutFile $tempInstaller
-
-            if ($downloadResult.Success) {
-                # Calculate hash for this architecture
-                $hash = Get-FileSha256 -FilePath $tempInstaller
-                $archHashes[$arch] = $hash
-                Write-Host "    ✅ SHA256: $hash" -ForegroundColor Green
-
-                # Extract ProductCode for MSI installers
-                if ($installerExtension -eq '.msi') {
-                    $archProductCode = Get-MsiProductCode -FilePath $tempInstaller
-                    if ($archProductCode) {
-                        $archProductCodes[$arch] = [string]$archProductCode
-                        Write-Host "    ✅ ProductCode: $archProductCode" -ForegroundColor Green
-                    }
+        if ($allHashesProvided) {
+            Write-Host "Multi-architecture package - using installer hashes from version_info.json (download skipped)" -ForegroundColor Cyan
+            foreach ($arch in $installerUrls.Keys) {
+                $archHashes[$arch] = $providedArchHashes[$arch].Hash
+            }
+        } else {
+            Write-Host "Multi-architecture package - downloading all installers..." -ForegroundColor Cyan
+
+            # Process every architecture concurrently; each installer is hashed while it streams
+            # and its MSI/MSIX metadata is extracted in the same worker
+            $downloads = $installerUrls.GetEnumerator() | ForEach-Object -ThrottleLimit ([Math]::Min(4, $installerUrls.Count)) -Parallel {
+                Import-Module $using:modulePath
+                $arch = $_.Key
+                $url = $_.Value
+
+                # Detect installer type from URL
+                $installerExtension = [System.IO.Path]::GetExtension($url).ToLower()
+                if ($installerExtension -eq '') {
+                    # Try to detect from URL pattern
+                    if ($url -match '\.msi($|\?)') { $installerExtension = '.msi' }
+                    elseif ($url -match '\.msix($|\?)') { $installerExtension = '.msix' }
+                    elseif ($url -match '\.appx($|\?)') { $installerExtension = '.appx' }
+                    else { $installerExtension = '.exe' }
                 }
 
-                # Extract SignatureSha256 for MSIX/APPX packages
-                if ($installerExtension -in @('.msix', '.appx')) {
-                    $archSig = Get-MsixSignatureSha256 -FilePath $tempInstaller
-                    if ($archSig) {
-                        $archSignatures[$arch] = $archSig
-                        Write-Host "    ✅ SignatureSha256: $archSig" -ForegroundColor Green
+                # Only MSI/MSIX need the file afterwards; other installers are hashed in flight
+                $tempInstaller = $null
+                if ($installerExtension -in @('.msi', '.msix', '.appx')) {
+                    $tempInstaller = Join-Path $using:workDir "installer-$arch$installerExtension"
+                }
+                $downloadResult = Get-WebFile -Url $url -OutFile $tempInstaller
+
+                $archProductCode = $null
+                $archSig = $null
+                if ($downloadResult.Success) {
+                    if ($installerExtension -eq '.msi') {
+                        $archProductCode = Get-MsiProductCode -FilePath $tempInstaller
+                    } elseif ($installerExtension -in @('.msix', '.appx')) {
+                        $archSig = Get-MsixSignatureSha256 -FilePath $tempInstaller
                     }
                 }
 
-                Remove-Item $tempInstaller -Force
-            } else {
-                Write-Warning "    ❌ Could not download installer for $arch"
+                [PSCustomObject]@{
+                    Arch = $arch
+                    Url = $url
+                    Success = $downloadResult.Success
+                    Hash = $downloadResult.Sha256
+                    ProductCode = $archProductCode
+                    SignatureSha256 = $archSig
+                }
+            }
+
+            foreach ($download in $downloads) {
+                $arch = $download.Arch
+                Write-Host "`n  Processing $arch architecture..." -ForegroundColor Cyan
+                Write-Host "    URL: $($download.Url)" -ForegroundColor Gray
+
+                if ($download.Success) {
+                    $archHashes[$arch] = $download.Hash
+                    Write-Host "    ✅ SHA256: $($download.Hash)" -ForegroundColor Green
+
+                    if ($download.ProductCode) {
+                        $archProductCodes[$arch] = [string]$download.ProductCode
+                        Write-Host "    ✅ ProductCode: $($download.ProductCode)" -ForegroundColor Green
+                    }
+
+                    if ($download.SignatureSha256) {
+                        $archSignatures[$arch] = $download.SignatureSha256
+                        Write-Host "    ✅ SignatureSha256: $($download.SignatureSha256)" -ForegroundColor Green
+                    }
+                } else {
+                    Write-Warning "    ❌ Could not download installer for $arch"
+                }
             }
         }
 
@@ -246,7 +349,11 @@ try {
         if ($archHashes.ContainsKey('x64')) {
             $installerHash = $archHashes['x64']
         } elseif ($archHashes.Count -gt 0) {
-            $installerHash = $archHashes.Values | Select-Object -First 1
+            # First value without running the pipeline
+            foreach ($value in $archHashes.Values) {
+                $installerHash = $value
+                break
+            }
         }
 
         Write-Host "`n📊 Multi-architecture download summary:" -ForegroundColor Cyan
@@ -261,6 +368,10 @@ try {
             exit 1
         }
 
+    } elseif ($providedHash -and $versionInfo.installerUrl -eq $primaryUrl -and $primaryUrl -notmatch '\.(msi|msix|appx)($|\?)') {
+        # Single architecture with upstream-published digest: no download needed
+        $installerHash = $providedHash
+        Write-Host "✅ Using SHA256 from version_info.json (download skipped): $installerHash" -ForegroundColor Green
     } else {
         # Single architecture: Download one installer
         # Detect installer type from URL
@@ -273,7 +384,11 @@ try {
             else { $installerExtension = '.exe' }
         }
 
-        $tempInstaller = Join-Path $TempDir "installer-$(Get-Random)$installerExtension"
+        # Only MSI/MSIX need the file afterwards; other installers are hashed in flight
+        $tempInstaller = $null
+        if ($installerExtension -in @('.msi', '.msix', '.appx')) {
+            $tempInstaller = Join-Path $workDir "installer$installerExtension"
+        }
         $downloadResult = Get-WebFile -Url $primaryUrl -OutFile $tempInstaller
 
         if ($downloadResult.Success) {
@@ -290,8 +405,8 @@ try {
                 Write-Host "   Consider updating the checkver config to use the final URL directly.`n" -ForegroundColor Yellow
             }
 
-            # Calculate installer hash
-            $installerHash = Get-FileSha256 -FilePath $tempInstaller
+            # Installer hash was computed while downloading
+            $installerHash = $downloadResult.Sha256
             Write-Host "✅ Calculated SHA256: $installerHash" -ForegroundColor Green
 
             # Extract ProductCode for MSI installers
@@ -305,8 +420,6 @@ try {
                 Write-Host "`nCalculating SignatureSha256 for MSIX..." -ForegroundColor Cyan
                 $signatureSha256 = Get-MsixSignatureSha256 -FilePath $tempInstaller
             }
-
-            Remove-Item $tempInstaller -Force
         } else {
             Write-Error "❌ Failed to download installer for single-architecture package!"
             Write-Host "URL: $primaryUrl" -ForegroundColor Yellow
@@ -314,68 +427,94 @@ try {
         }
     }
 
+    # The template is needed from here on
+    $templateFetched = $templateJob | Receive-Job -Wait -AutoRemoveJob | Select-Object -Last 1
+    $templateJob = $null
+    if (-not $templateFetched) {
+        throw "Failed to fetch template manifest"
+    }
+
     # Copy and update manifest files
     Write-Host "`nUpdating manifest files..." -ForegroundColor Cyan
-    $manifestFiles = Get-ChildItem -Path $templateDir -Filter "*.yaml"
-
-    foreach ($file in $manifestFiles) {
-        $destFile = Join-Path $newVersionDir $file.Name
-        Copy-Item $file.FullName $destFile -Force
-
-        Write-Host "  Updating: $($file.Name)" -ForegroundColor Gray
+    # Enumerate paths directly; only the names are needed, not FileInfo objects
+    $manifestFiles = [System.IO.Directory]::EnumerateFiles($templateDir, '*.yaml')
+    $manifestUpdates = [System.Collections.Generic.List[hashtable]]::new()
+    $releaseDate = (Get-Date).ToString("yyyy-MM-dd")
+
+    # Everything except the file paths is the same for every manifest, so build it once
+    $commonParams = @{
+        OldVersion = $latestVersion
+        NewVersion = $Version
+        ReleaseDate = $releaseDate
+    }
 
-        # Update manifest with all extracted data
-        $updateParams = @{
-            FilePath = $destFile
-            OldVersion = $latestVersion
-            NewVersion = $Version
+    # Add architecture-specific hashes if available
+    if ($archHashes.Count -gt 0) {
+        Write-Host "  ℹ️  Applying architecture-specific hashes: $($archHashes.Count) architectures" -ForegroundColor Cyan
+        foreach ($arch in $archHashes.Keys) {
+            Write-Host "    $arch : $($archHashes[$arch])" -ForegroundColor Gray
         }
-
-        # Add architecture-specific hashes if available
-        if ($archHashes.Count -gt 0) {
-            Write-Host "    ℹ️  Applying architecture-specific hashes: $($archHashes.Count) architectures" -ForegroundColor Cyan
-            foreach ($arch in $archHashes.Keys) {
-                Write-Host "      $arch : $($archHashes[$arch])" -ForegroundColor Gray
-            }
-            $updateParams['ArchHashes'] = $archHashes
-            # Also add arch-specific ProductCodes and SignatureSha256 if available
-            if ($archProductCodes.Count -gt 0) {
-                $updateParams['ArchProductCodes'] = $archProductCodes
-            }
-            if ($archSignatures.Count -gt 0) {
-                $updateParams['ArchSignatures'] = $archSignatures
-            }
+        $commonParams['ArchHashes'] = $archHashes
+        # Also add arch-specific ProductCodes and SignatureSha256 if available
+        if ($archProductCodes.Count -gt 0) {
+            $commonParams['ArchProductCodes'] = $archProductCodes
+        }
+        if ($archSignatures.Count -gt 0) {
+            $commonParams['ArchSignatures'] = $archSignatures
+        }
+    } else {
+        # Single architecture - use legacy single hash parameter
+        if ($installerHash) {
+            Write-Host "  ℹ️  Applying single-architecture hash: $installerHash" -ForegroundColor Cyan
+            $commonParams['Hash'] = $installerHash
         } else {
-            # Single architecture - use legacy single hash parameter
-            if ($installerHash) {
-                Write-Host "    ℹ️  Applying single-architecture hash: $installerHash" -ForegroundColor Cyan
-                $updateParams['Hash'] = $installerHash
-            } else {
-                Write-Warning "    ⚠️  No installer hash available - manifest will not be updated with new hash!"
-            }
-            if ($productCode) {
-                $updateParams['ProductCode'] = [string]$productCode
-            }
-            if ($signatureSha256) {
-                $updateParams['SignatureSha256'] = $signatureSha256
-            }
+            Write-Warning "  ⚠️  No installer hash available - manifest will not be updated with new hash!"
         }
-
-        if (-not $installerUrls) {
-            $updateParams['InstallerUrl'] = $primaryUrl
+        if ($productCode) {
+            $commonParams['ProductCode'] = [string]$productCode
+        }
+        if ($signatureSha256) {
+            $commonParams['SignatureSha256'] = $signatureSha256
         }
+    }
+
+    if (-not $installerUrls) {
+        $commonParams['InstallerUrl'] = $primaryUrl
+    }
+
+    foreach ($sourceFile in $manifestFiles) {
+        $fileName = [System.IO.Path]::GetFileName($sourceFile)
+
+        Write-Host "  Updating: $fileName" -ForegroundColor Gray
 
-        Update-ManifestYaml @updateParams
+        # Update manifest with all extracted data, reading the template and writing the new file
+        $updateParams = $commonParams.Clone()
+        $updateParams['FilePath'] = $sourceFile
+        $updateParams['OutputPath'] = Join-Path $newVersionDir $fileName
+
+        $manifestUpdates.Add($updateParams)
     }
 
-    # Cleanup template directory
-    Remove-Item $templateDir -Recurse -Force
+    # Files are independent, but starting a runspace costs far more than editing a small
+    # YAML file, so only fan out for packages with many locale manifests
+    if ($manifestUpdates.Count -ge 8) {
+        $manifestUpdates | ForEach-Object -ThrottleLimit 8 -Parallel {
+            Import-Module $using:modulePath
+            $updateParams = $_
+            Update-ManifestYaml @updateParams
+        }
+    } else {
+        foreach ($updateParams in $manifestUpdates) {
+            Update-ManifestYaml @updateParams
+        }
+    }
 
     # Validate manifest files before publishing
     if (-not (Test-WinGetManifest -ManifestPath $newVersionDir)) {
         Write-Error "Manifest validation failed. Please review the errors above."
         Write-Host "`nManifest directory: $newVersionDir" -ForegroundColor Yellow
         Write-Host "You can manually validate with: winget validate --manifest `"$newVersionDir`"" -ForegroundColor Gray
+        $keepWorkDir = $true
         exit 1
     }
 
@@ -397,13 +536,25 @@ try {
         Write-Host "`n✅ Manifest updated successfully (no PR created)" -ForegroundColor Green
     }
 
-    # Cleanup temp directory
-    Remove-Item $newVersionDir -Recurse -Force -ErrorAction SilentlyContinue
-
     Write-Host "`n✅ Update completed successfully!" -ForegroundColor Green
+
+    # Explicit: callers in the same session read $LASTEXITCODE, which would otherwise still
+    # hold the code of the last native command (e.g. a tolerated 'gh pr edit' failure)
+    exit 0
 }
 catch {
     Write-Error "`n❌ Error updating manifest: $_"
     Write-Error $_.ScriptStackTrace
     exit 1
 }
+finally {
+    # Stop a template fetch still running after an early exit
+    if ($templateJob) {
+        Remove-Job $templateJob -Force -ErrorAction SilentlyContinue
+    }
+
+    # Cleanup work directory (kept when validation failed so it can be inspected)
+    if (-not $keepWorkDir) {
+        Remove-Item $workDir -Recurse -Force -ErrorAction SilentlyContinue
+    }
+}